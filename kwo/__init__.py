@@ -1,13 +1,10 @@
 """A python2/3 compatible interface to keyword only arguments.
 """
-from functools import wraps
-import inspect
+from inspect import CO_VARARGS, CO_VARKEYWORDS
 import itertools
-import operator as op
+from linecache import getline
 import sys
-from textwrap import dedent
 from types import CodeType
-from uuid import uuid4
 
 
 PY3 = sys.version_info[0] >= 3
@@ -30,14 +27,22 @@ _code_argorder = (
     'co_cellvars',
 )
 
-if PY3:  # pragma: no cover
-    zip_longest = itertools.zip_longest
+if hasattr(CodeType, 'replace'):  # pragma: no cover
+    def _replace_code(code, overrides):
+        return code.replace(**overrides)
 else:  # pragma: no cover
-    zip_longest = itertools.izip_longest
+    def _replace_code(code, overrides):
+        return CodeType(*(
+            overrides[attr] if attr in overrides else getattr(code, attr)
+            for attr in _code_argorder
+        ))
+
+
+_private_namespace_counter = itertools.count()
 
 
 def private_namespace(name):
-    """Prefix a name with a random string so it doesn't collide with other
+    """Prefix a name with a unique string so it doesn't collide with other
     names.
 
     Parameters
@@ -50,38 +55,52 @@ def private_namespace(name):
     hidden : str
         The mangled name.
     """
-    return '_%s_%s' % (uuid4().hex, name)
+    return '_kwo_%d_%s' % (next(_private_namespace_counter), name)
 
 
-def no_default():
-    """A marker indicating that a kwonly argument does not have a default
-    argument. This is implemented as a function to serialize correctly.
+class _Sentinel(object):
+    """Base class for marker values which are only compared by identity.
 
-    Note
-    ----
-    Don't call this function, it is just a sentinel value.
+    Notes
+    -----
+    Each subclass has a single instance stored at module scope under
+    ``_name``. Instances pickle as a reference to that name so they
+    round trip to the same object.
     """
-    raise AssertionError(
-        'no_default is just a sentinel, why are you calling this?',
-    )
+    __slots__ = ()
 
+    def __repr__(self):
+        return self._name
 
-def vararg():
-    """A markeer indicating that an argument is a variadic argument,
-    like *args.
+    def __reduce__(self):
+        return self._name
 
-    Note
-    ----
-    Don't call this function, it is just a sentinel value.
+
+class _NoDefault(_Sentinel):
+    """A marker indicating that a kwonly argument does not have a default
+    argument.
+    """
+    __slots__ = ()
+    _name = 'no_default'
+
+
+no_default = _NoDefault()
+
+
+class _VarArg(_Sentinel):
+    """A marker indicating that an argument is a variadic argument,
+    like *args.
 
     See Also
     --------
     :func:`~kwonly.with_kwonly`
     :func:`~kwonly.kwonly`
     """
-    raise AssertionError(
-        'vararg is just a sentinel, why are you calling this?',
-    )
+    __slots__ = ()
+    _name = 'vararg'
+
+
+vararg = _VarArg()
 
 
 class kwonly(object):
@@ -107,28 +126,184 @@ class kwonly(object):
     See Also
     --------
     :func:`~kwonly.with_kwonly`
-    :func:`~kwonly.vararg`
+    :data:`~kwonly.vararg`
     """
+    __slots__ = 'default',
+
     def __init__(self, default=no_default):
         object.__setattr__(self, 'default', default)
 
     def __setattr__(self, attr, value):
         raise AttributeError('kwonly objects are immutable')
 
+    def __reduce__(self):
+        return kwonly, (self.default,)
+
 
 def _format_syntax_error(f, msg):
     code = f.__code__
     filename = code.co_filename
     lno = code.co_firstlineno
-    try:
-        with open(filename) as f:
-            line = f.readlines()[lno - 1]
-    except IOError:  # pragma: no cover
-        line = '???'
+    line = getline(filename, lno) or '???'
 
     return SyntaxError(msg, (filename, lno, len(line), line))
 
 
+def _missing_kwonlies_message(f, missing_kwonlies):
+    n_missing = len(missing_kwonlies)
+    plural = 's'
+    if n_missing == 1:
+        args = repr(missing_kwonlies[0])
+        plural = ''
+    elif n_missing == 2:
+        args = '%r and %r' % tuple(missing_kwonlies)
+    else:
+        args = ', and '.join((
+            ', '.join(map(repr, missing_kwonlies[:-1])),
+            repr(missing_kwonlies[-1]),
+        ))
+    return '%s() missing %d required keyword-only argument%s: %s' % (
+        f.__name__,
+        n_missing,
+        plural,
+        args,
+    )
+
+
+# cache of compiled ``make_function`` templates keyed by the shape of the
+# signature being rewritten
+_make_function_code_cache = {}
+
+
+def _make_function_code(args,
+                        kwonly_names,
+                        kwonly_required,
+                        found_vararg,
+                        keywords):
+    """Get the compiled code which defines ``make_function`` for a given
+    signature shape.
+
+    Parameters
+    ----------
+    args : tuple[str]
+        The names of the positional arguments of the decorated function.
+    kwonly_names : tuple[str]
+        The names of the arguments which should be keyword only.
+    kwonly_required : tuple[bool]
+        Whether or not each keyword only argument is missing a default.
+    found_vararg : str or None
+        The name of the variadic argument, if any.
+    keywords : str or None
+        The name of the ``**kwargs`` argument, if any.
+
+    Returns
+    -------
+    code : CodeType
+        The code object to exec in a namespace with ``f`` defined. When
+        there are keyword only arguments, ``kwonly_defaults`` must also be
+        defined. On python 2 with required keyword only arguments,
+        ``no_default`` and ``missing_kwonlies`` must be defined too.
+
+    Notes
+    -----
+    Many decorated functions share the same signature so the generated code
+    is cached to avoid recompiling the same source.
+    """
+    key = args, kwonly_names, kwonly_required, found_vararg, keywords
+    try:
+        return _make_function_code_cache[key]
+    except KeyError:
+        pass
+
+    wrapper_parts = [
+        arg for arg in args
+        if arg not in kwonly_names and arg != found_vararg
+    ]
+    call_parts = wrapper_parts[:]
+    if found_vararg:
+        wrapper_parts.append('*' + found_vararg)
+        call_parts.append(found_vararg)
+
+    call_parts.extend(['%s=%s' % (name, name) for name in kwonly_names])
+
+    default_names = [
+        '_kwo_default_%d' % n for n in range(len(kwonly_names))
+    ]
+    if PY3 and kwonly_names:
+        # let the interpreter bind the keyword only arguments and report any
+        # missing ones
+        if not found_vararg:
+            wrapper_parts.append('*')
+        wrapper_parts.extend(
+            name if required else '%s=%s' % (name, default_name)
+            for name, required, default_name in zip(
+                kwonly_names,
+                kwonly_required,
+                default_names,
+            )
+        )
+
+    if keywords:
+        kwargname = keywords
+    else:
+        kwargname = private_namespace('kwargs')
+
+    added = '**' + kwargname
+    call_parts.append(added)
+    wrapper_parts.append(added)
+
+    # on python 3 the interpreter reports missing keyword only arguments
+    required_names = [] if PY3 else [
+        name for name, required in zip(kwonly_names, kwonly_required)
+        if required
+    ]
+    make_function_argspec_str = ', '.join(
+        ['_kwo_f=f'] + ([
+            '_kwo_no_default=no_default',
+            '_kwo_missing_kwonlies=missing_kwonlies',
+        ] if required_names else []) + [
+            '%s=kwonly_defaults[%d]' % (default_name, n)
+            for n, (default_name, required) in enumerate(zip(
+                default_names,
+                kwonly_required,
+            ))
+            if not (PY3 and required)
+        ],
+    )
+
+    lines = [
+        'def make_function(%s):' % make_function_argspec_str,
+        '    def function(%s):' % ', '.join(wrapper_parts),
+    ]
+    if not PY3:
+        lines.extend(
+            '        %s = %s.pop(%r, %s)' % (
+                name,
+                kwargname,
+                name,
+                default_name,
+            )
+            for name, default_name in zip(kwonly_names, default_names)
+        )
+    if required_names:
+        lines.append('        if %s:' % ' or '.join(
+            '%s is _kwo_no_default' % name for name in required_names
+        ))
+        lines.append(
+            '            _kwo_missing_kwonlies(%s)' % ', '.join(kwonly_names),
+        )
+    lines.append('        return _kwo_f(%s)' % ', '.join(call_parts))
+    lines.append('    return function')
+    source_code = '\n'.join(lines) + '\n'
+
+    code = _make_function_code_cache[key] = compile(
+        source_code,
+        '<kwo>',
+        'exec',
+    )
+    return code
+
+
 def with_kwonly(f):
     """Process any :class:`~kwonly.kwonly` arguments and rewrite the signature.
 
@@ -151,21 +326,35 @@ def with_kwonly(f):
     See Also
     --------
     :class:`~kwonly.kwonly`
-    :func:`~kwonly.vararg`
+    :data:`~kwonly.vararg`
     """
-    argspec = inspect.getargspec(f)
-    defaults = reversed(list(zip_longest(
-        reversed(argspec.args),
-        reversed(argspec.defaults or ()),
-        fillvalue=no_default,
-    )))
+    defaults = f.__defaults__ or ()
+    if not any(isinstance(d, kwonly) or d is vararg for d in defaults):
+        # fast path when we have no kwonly args or varargs to process
+        return f
+
+    code = f.__code__
+    varnames = code.co_varnames
+    n_args = code.co_argcount
+    args = varnames[:n_args]
+    # on python 3 the real keyword only arguments come before the variadic
+    # arguments in ``co_varnames``
+    n_args += getattr(code, 'co_kwonlyargcount', 0)
+    varargs = keywords = None
+    if code.co_flags & CO_VARARGS:
+        varargs = varnames[n_args]
+        n_args += 1
+    if code.co_flags & CO_VARKEYWORDS:
+        keywords = varnames[n_args]
 
     kwonly_defaults = []
     found_kwonly = None
-    found_vararg = argspec.varargs
-    real_vararg = argspec.varargs is not None
+    found_vararg = varargs
+    real_vararg = varargs is not None
 
-    for name, value in defaults:
+    # arguments without defaults come before any sentinel so they can never
+    # be rewritten or be out of order; only walk the defaulted arguments
+    for name, value in zip(args[len(args) - len(defaults):], defaults):
         if isinstance(value, kwonly):
             found_kwonly = name
             kwonly_defaults.append((name, value.default))
@@ -191,102 +380,67 @@ def with_kwonly(f):
                 ),
             )
 
-    if found_kwonly is None and found_vararg is argspec.varargs:
-        # fast path when we have no kwonly args to process
-        return f
-
-    kwonly_names = list(map(op.itemgetter(0), kwonly_defaults))
-
-    def extract_kwonlies(kwargs,
-                         kwonly_defaults=kwonly_defaults,
-                         no_default=no_default):
-        ret = []
-        missing_kwonlies = []
-        for name, default in kwonly_defaults:
-            value = kwargs.pop(name, default)
-            if value is no_default:
-                missing_kwonlies.append(name)
-            else:
-                ret.append(value)
-
-        if missing_kwonlies:
-            n_missing = len(missing_kwonlies)
-            plural = 's'
-            if n_missing == 1:
-                args = repr(missing_kwonlies[0])
-                plural = ''
-            elif n_missing == 2:
-                args = '%r and %r' % tuple(missing_kwonlies)
-            else:
-                args = ', and '.join((
-                    ', '.join(map(repr, missing_kwonlies[:-1])),
-                    repr(missing_kwonlies[-1]),
-                ))
-            raise TypeError(
-                '%s() missing %d required keyword-only argument%s: %s' % (
-                    f.__name__,
-                    n_missing,
-                    plural,
-                    args,
-                ),
-            )
-
-        return ret
+    kwonly_names = [name for name, _ in kwonly_defaults]
 
-    wrapper_argspec_str = ', '.join(
-        arg for arg in argspec.args
-        if arg not in kwonly_names and arg != found_vararg
+    kwonly_required = tuple(
+        default is no_default for _, default in kwonly_defaults
     )
-    call_sig_str = wrapper_argspec_str
-    if found_vararg:
-        added = ', *' + found_vararg
-        call_sig_str += ', ' + found_vararg
-        wrapper_argspec_str += added
-
-    call_sig_str += ', ' + ', '.join(map('{0}={0}'.format, kwonly_names))
-
-    if argspec.keywords:
-        kwargname = argspec.keywords
-    else:
-        kwargname = private_namespace('kwargs')
 
-    added = ', **' + kwargname
-    call_sig_str += added
-    wrapper_argspec_str += added
-
-    extract_kwonlies_name = private_namespace('extract_kwonlies')
-    source_code = dedent(
-        """\
-        def make_function({extract_kwonlies}=extract_kwonlies):
-            def function({wrapper_argspec}):
-                {assign_kwonlies}
-                return f({call_sig})
-            return function
-        """,
-    ).format(
-        extract_kwonlies=extract_kwonlies_name,
-        wrapper_argspec=wrapper_argspec_str,
-        assign_kwonlies='{kwonlies}, = {extract_kwonlies}({kwargname})'.format(
-            extract_kwonlies=extract_kwonlies_name,
-            kwonlies=', '.join(kwonly_names),
-            kwargname=kwargname,
-        ) if kwonly_defaults else '',
-        call_sig=call_sig_str,
+    ns = {'f': f}
+    if kwonly_defaults:
+        ns['kwonly_defaults'] = [default for _, default in kwonly_defaults]
+    if not PY3 and any(kwonly_required):
+        # error messages keyed by the tuple of missing kwonly names; these
+        # are formatted the first time each combination is seen
+        missing_messages = {}
+
+        def missing_kwonlies(*values):
+            missing = tuple(
+                name for name, value in zip(kwonly_names, values)
+                if value is no_default
+            )
+            try:
+                message = missing_messages[missing]
+            except KeyError:
+                message = missing_messages[missing] = (
+                    _missing_kwonlies_message(f, missing)
+                )
+            raise TypeError(message)
+
+        ns['no_default'] = no_default
+        ns['missing_kwonlies'] = missing_kwonlies
+
+    exec(
+        _make_function_code(
+            args,
+            tuple(kwonly_names),
+            kwonly_required,
+            found_vararg,
+            keywords,
+        ),
+        ns,
     )
-
-    ns = {'f': f, 'extract_kwonlies': extract_kwonlies}
-    compiled = compile(source_code, f.__code__.co_filename, 'exec')
-    exec(compiled, ns)
-    new_f = wraps(f)(ns['make_function']())
-    code = new_f.__code__
-    args = {
-        attr: getattr(code, attr)
-        for attr in dir(code)
-        if attr.startswith('co_')
+    new_f = ns['make_function']()
+    new_f.__module__ = f.__module__
+    new_f.__name__ = f.__name__
+    if PY3:  # pragma: no cover
+        new_f.__qualname__ = f.__qualname__
+        new_f.__annotations__ = f.__annotations__
+        if hasattr(f, '__type_params__'):
+            new_f.__type_params__ = f.__type_params__
+    new_f.__doc__ = f.__doc__
+    if f.__dict__:
+        new_f.__dict__.update(f.__dict__)
+    new_f.__wrapped__ = f
+    new_code = new_f.__code__
+    overrides = {
+        'co_filename': code.co_filename,
+        'co_name': code.co_name,
+        'co_firstlineno': code.co_firstlineno,
     }
-    args['co_name'] = f.__code__.co_name
-    args['co_firstlineno'] = f.__code__.co_firstlineno
-    new_f.__code__ = CodeType(*(args[arg] for arg in _code_argorder))
+    if hasattr(code, 'co_qualname'):  # pragma: no cover
+        overrides['co_qualname'] = code.co_qualname
+    new_f.__code__ = _replace_code(new_code, overrides)
     return new_f
 
 __all__ = [
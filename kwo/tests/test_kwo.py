@@ -1,26 +1,46 @@
+import copy
+import pickle
+import sys
+
 import pytest
 
 from kwo import kwonly, vararg, with_kwonly, no_default
 
 
-def test_no_default_raises():
-    with pytest.raises(AssertionError) as e:
-        no_default()
+def error_name(f):
+    """The name the interpreter uses for ``f`` in argument errors. Starting
+    in python 3.10 this is the qualified name.
+    """
+    if sys.version_info >= (3, 10):  # pragma: no cover
+        return f.__qualname__
+    return f.__name__  # pragma: no cover
 
-    assert (
-        str(e.value) ==
-        'no_default is just a sentinel, why are you calling this?'
-    )
 
+def test_sentinel_repr():
+    assert repr(no_default) == 'no_default'
+    assert repr(vararg) == 'vararg'
 
-def test_vararg_raises():
-    with pytest.raises(AssertionError) as e:
-        vararg()
 
-    assert (
-        str(e.value) ==
-        'vararg is just a sentinel, why are you calling this?'
-    )
+@pytest.mark.parametrize('sentinel', [no_default, vararg])
+def test_sentinel_pickle(sentinel):
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        assert pickle.loads(pickle.dumps(sentinel, protocol)) is sentinel
+
+
+def test_kwonly_pickle_and_copy():
+    def roundtrips(attr):
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            yield pickle.loads(pickle.dumps(attr, protocol))
+        yield copy.copy(attr)
+        yield copy.deepcopy(attr)
+
+    for attr in roundtrips(kwonly(1)):
+        assert isinstance(attr, kwonly)
+        assert attr.default == 1
+
+    for attr in roundtrips(kwonly()):
+        assert isinstance(attr, kwonly)
+        assert attr.default is no_default
 
 
 def test_kwonly_immutable():
@@ -31,6 +51,12 @@ def test_kwonly_immutable():
     assert str(e.value) == 'kwonly objects are immutable'
 
 
+def test_kwonly_slots():
+    attr = kwonly('default')
+    assert attr.default == 'default'
+    assert not hasattr(attr, '__dict__')
+
+
 def test_non_kwonly_after_kwonly():
     with pytest.raises(SyntaxError) as e:
         @with_kwonly
@@ -75,7 +101,10 @@ def test_kwonly_no_default():
     with pytest.raises(TypeError) as e:
         f(1)
 
-    assert str(e.value) == "f() missing 1 required keyword-only argument: 'b'"
+    assert (
+        str(e.value) ==
+        "%s() missing 1 required keyword-only argument: 'b'" % error_name(f)
+    )
 
     assert f(1, b=2) == (1, 2)
 
@@ -93,7 +122,8 @@ def test_kwonly_no_default():
 
     assert (
         str(e.value) ==
-        "g() missing 2 required keyword-only arguments: 'b' and 'c'"
+        "%s() missing 2 required keyword-only arguments: 'b' and 'c'" %
+        error_name(g)
     )
 
     assert g(1, b=2, c=3) == (1, 2, 3)
@@ -112,7 +142,8 @@ def test_kwonly_no_default():
 
     assert (
         str(e.value) ==
-        "h() missing 3 required keyword-only arguments: 'b', 'c', and 'd'"
+        "%s() missing 3 required keyword-only arguments: 'b', 'c', and 'd'" %
+        error_name(h)
     )
 
     assert h(1, b=2, c=3, d=4) == (1, 2, 3, 4)
@@ -123,3 +154,99 @@ def test_no_work_fast_path():
         pass
 
     assert with_kwonly(f) is f
+
+
+def test_same_signature_shape():
+    @with_kwonly
+    def f(a, b=kwonly()):
+        return 'f', a, b
+
+    @with_kwonly
+    def g(a, b=kwonly()):
+        return 'g', a, b
+
+    assert f(1, b=2) == ('f', 1, 2)
+    assert g(1, b=2) == ('g', 1, 2)
+
+    assert f.__code__.co_name == 'f'
+    assert g.__code__.co_name == 'g'
+    assert (
+        f.__code__.co_filename ==
+        test_same_signature_shape.__code__.co_filename
+    )
+
+
+def test_real_keywords():
+    @with_kwonly
+    def f(a, b=kwonly(), **kw):
+        return a, b, kw
+
+    assert f(1, b=2, c=3) == (1, 2, {'c': 3})
+
+
+def test_no_sentinel_defaults_fast_path():
+    def f(a, b=1, c='c'):  # pragma: no cover
+        pass
+
+    assert with_kwonly(f) is f
+
+
+def test_vararg_only():
+    @with_kwonly
+    def f(a, args=vararg):
+        return a, args
+
+    assert f(1, 2, 3) == (1, (2, 3))
+
+
+def test_no_positional_args():
+    @with_kwonly
+    def f(b=kwonly()):
+        return b
+
+    assert f(b=1) == 1
+
+
+def test_argument_named_f():
+    @with_kwonly
+    def g(f, b=kwonly()):
+        return f, b
+
+    assert g(1, b=2) == (1, 2)
+
+
+def test_wrapper_attributes():
+    def f(a, b=kwonly()):
+        """docstring"""
+        return a, b
+
+    f.attr = 'attr'
+    # set directly because annotation syntax does not parse on python 2
+    f.__annotations__ = {'a': int, 'b': str, 'return': int}
+    if hasattr(f, '__type_params__'):  # pragma: no cover
+        from typing import TypeVar
+        f.__type_params__ = (TypeVar('T'),)
+    g = with_kwonly(f)
+
+    assert g.__name__ == 'f'
+    assert g.__module__ == f.__module__
+    assert g.__doc__ == 'docstring'
+    assert g.attr == 'attr'
+    assert g.__wrapped__ is f
+    assert g.__annotations__ == {'a': int, 'b': str, 'return': int}
+    if hasattr(f, '__type_params__'):  # pragma: no cover
+        assert g.__type_params__ == f.__type_params__
+
+
+def test_code_attributes():
+    def f(a, b=kwonly()):  # pragma: no cover
+        pass
+
+    code = f.__code__
+    new_code = with_kwonly(f).__code__
+
+    assert new_code.co_name == code.co_name
+    assert new_code.co_filename == code.co_filename
+    assert new_code.co_firstlineno == code.co_firstlineno
+    if hasattr(code, 'co_qualname'):  # pragma: no cover
+        assert new_code.co_qualname == code.co_qualname